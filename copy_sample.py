@@ -1,9 +1,44 @@
 #!/usr/bin/env python3
 import os
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import sys
 
+# Copies are metadata/IO latency bound, so threads overlap syscalls well past cpu count
+MAX_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+# Drain pending copies every N submissions to bound memory on huge trees;
+# divides the 1000-file progress interval so progress only counts finished copies
+DRAIN_EVERY = 250
+
+def drain(futures):
+    """Wait for pending copies and return how many completed."""
+    for future in futures:
+        future.result()
+    completed = len(futures)
+    futures.clear()
+    return completed
+
+def walk_files(dirpath):
+    """Yield (dirpath, regular file names) top-down, reusing DirEntry d_type instead of re-stating."""
+    file_names = []
+    sub_dirs = []
+    try:
+        entries = os.scandir(dirpath)
+    except OSError:
+        # Skip unreadable dirs (root-only .Trashes/.Spotlight-V100 on volumes) like os.walk
+        return
+    with entries:
+        for entry in entries:
+            # Only regular files, ignore weird entries / symlinks
+            if entry.is_file(follow_symlinks=False):
+                file_names.append(entry.name)
+            elif entry.is_dir(follow_symlinks=False):
+                sub_dirs.append(entry.path)
+    yield dirpath, file_names
+    for sub_dir in sub_dirs:
+        yield from walk_files(sub_dir)
+
 def main():
     # Source and destination roots (can be overridden by CLI args)
     src_root = Path("/Volumes/AGGR/input")
@@ -24,39 +59,39 @@ def main():
 
     copied_files = 0
     visited_dirs = 0
+    futures = []
+
+    executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+    try:
+        for dirpath, full_files in walk_files(src_root):
+            visited_dirs += 1
+
+            if not full_files:
+                continue
+
+            # Take up to 2 files; sort for determinism in large dirs
+            if len(full_files) > 2:
+                chosen = sorted(full_files)[:2]
+            else:
+                chosen = full_files
+
+            # All chosen files share this directory: create the destination once
+            dst_dir = dst_root / os.path.relpath(dirpath, src_root)
+            dst_dir.mkdir(parents=True, exist_ok=True)
+
+            for name in chosen:
+                # copyfile takes the platform zero-copy path (sendfile/fcopyfile/CopyFileW);
+                # samples don't need copy2's extra copystat chmod/utime syscalls
+                futures.append(executor.submit(shutil.copyfile, os.path.join(dirpath, name), dst_dir / name))
+
+                if len(futures) >= DRAIN_EVERY:
+                    copied_files += drain(futures)
+                    if copied_files % 1000 == 0:
+                        print(f"Copied {copied_files} files so far…")
 
-    for dirpath, dirnames, filenames in os.walk(src_root):
-        visited_dirs += 1
-
-        # Only regular files, ignore weird entries / symlinks
-        full_files = []
-        for name in filenames:
-            p = Path(dirpath) / name
-            # skip if not a real file (just in case)
-            if p.is_file():
-                full_files.append(name)
-
-        if not full_files:
-            continue
-
-        # Take up to 2 files; sort for determinism in large dirs
-        if len(full_files) > 2:
-            chosen = sorted(full_files)[:2]
-        else:
-            chosen = full_files
-
-        for name in chosen:
-            src_file = Path(dirpath) / name
-            rel_path = src_file.relative_to(src_root)
-            dst_file = dst_root / rel_path
-
-            dst_file.parent.mkdir(parents=True, exist_ok=True)
-            # copy2 keeps timestamps etc., but still simple enough
-            shutil.copy2(src_file, dst_file)
-            copied_files += 1
-
-            if copied_files % 1000 == 0:
-                print(f"Copied {copied_files} files so far…")
+        copied_files += drain(futures)
+    finally:
+        executor.shutdown(wait=True)
 
     print(f"Done. Visited {visited_dirs} directories.")
     print(f"Copied {copied_files} files in total.")
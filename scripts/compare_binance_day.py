@@ -1,20 +1,25 @@
 #!/usr/bin/env python3
 import argparse
-import gzip
+import datetime as dt
 import io
 import os
+import shutil
 import tempfile
 import urllib.request
-import zipfile
 from pathlib import Path
 from typing import Iterable, Optional, Tuple
 
+from inflate import ZipLineCounter, open_gzip, open_zip_member
+
 
 DATASET_URLS = {
     "spot-trades": "https://data.binance.vision/data/spot/daily/trades/{symbol}/{symbol}-trades-{date}.zip",
     "futures-um-trades": "https://data.binance.vision/data/futures/um/daily/trades/{symbol}/{symbol}-trades-{date}.zip",
 }
 
+PLAIN_COUNT_CHUNK = 8 * 1024 * 1024
+DOWNLOAD_CHUNK = 1024 * 1024
+
 
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(
@@ -60,35 +65,40 @@ def ensure_cache_dir(path: Optional[str]) -> Path:
 
 
 def parse_day_from_name(name: str) -> Optional[str]:
-    # Expected prefix: YYYY-MM-DD-...
-    if len(name) < 10:
+    # Expected prefix: YYYY-MM-DD-...; dt.date rejects impossible days (e.g. 2021-02-30).
+    if len(name) < 10 or name[4] != "-" or name[7] != "-":
         return None
-    prefix = name[:10]
-    parts = prefix.split("-")
-    if len(parts) != 3:
+    # int() alone would also take signs/spaces ("2021-+1-01").
+    if not (name[0:4] + name[5:7] + name[8:10]).isdigit():
         return None
-    if not all(p.isdigit() for p in parts):
+    try:
+        dt.date(int(name[0:4]), int(name[5:7]), int(name[8:10]))
+    except ValueError:
         return None
-    return prefix
+    return name[:10]
 
 
 def iter_day_files(directory: Path, day: str) -> Iterable[Path]:
+    # Filter the unsorted listing by name first, then sort only the day's ~24 hits;
+    # DirEntry.is_file reuses readdir's d_type instead of a stat per entry.
     prefix = f"{day}-"
-    for entry in sorted(directory.iterdir()):
-        if not entry.is_file():
-            continue
-        name = entry.name
-        if not name.startswith(prefix):
-            continue
-        if entry.suffix == ".gz" or entry.suffix == "":
-            yield entry
-
-
-def count_lines_stream(stream: io.BufferedReader) -> int:
+    with os.scandir(directory) as entries:
+        hits = [
+            entry.name
+            for entry in entries
+            if entry.name.startswith(prefix)
+            and (entry.name.endswith(".gz") or "." not in entry.name)
+            and entry.is_file()
+        ]
+    hits.sort()
+    return [directory / name for name in hits]
+
+
+def count_lines_stream(stream: io.BufferedReader, chunk_size: int = 1024 * 1024) -> int:
     total = 0
     last_chunk = b""
     while True:
-        chunk = stream.read(1024 * 1024)
+        chunk = stream.read(chunk_size)
         if not chunk:
             break
         total += chunk.count(b"\n")
@@ -99,34 +109,51 @@ def count_lines_stream(stream: io.BufferedReader) -> int:
 
 
 def count_lines_file(path: Path) -> int:
-    opener = gzip.open if path.suffix == ".gz" else open
-    with opener(path, "rb") as handle:
+    if path.suffix != ".gz":
+        # Plain files: unbuffered large reads, one syscall and one count per chunk.
+        with open(path, "rb", buffering=0) as handle:
+            return count_lines_stream(handle, PLAIN_COUNT_CHUNK)  # type: ignore[arg-type]
+    with open_gzip(path) as handle:
         return count_lines_stream(handle)
 
 
-def download_zip(url: str, cache_dir: Path) -> Optional[Path]:
+def download_zip(
+    url: str,
+    cache_dir: Path,
+    line_counter: Optional[ZipLineCounter] = None,
+) -> Optional[Path]:
+    # line_counter, when given, sees every downloaded chunk (cache hits feed nothing).
     name = url.rsplit("/", 1)[-1]
     target = cache_dir / name
     if target.exists():
         return target
+    # Stream to a sibling temp file so memory stays O(chunk) and a failed
+    # download never leaves a truncated zip behind as a cache hit.
+    partial = target.with_name(f"{name}.part")
     try:
-        with urllib.request.urlopen(url) as resp, open(target, "wb") as out:
-            out.write(resp.read())
+        with urllib.request.urlopen(url) as resp, open(partial, "wb") as out:
+            if line_counter is None:
+                shutil.copyfileobj(resp, out, DOWNLOAD_CHUNK)
+            else:
+                # Same single pass over the bytes: write to cache and count lines in flight.
+                for chunk in iter(lambda: resp.read(DOWNLOAD_CHUNK), b""):
+                    out.write(chunk)
+                    line_counter.feed(chunk)
+        partial.replace(target)
         return target
     except Exception as exc:  # noqa: BLE001
+        partial.unlink(missing_ok=True)
         print(f"  download failed: {url} ({exc})")
         return None
 
 
 def count_binance_trades(zip_path: Path) -> Tuple[int, Optional[str]]:
-    with zipfile.ZipFile(zip_path) as zf:
-        names = [n for n in zf.namelist() if not n.endswith("/")]
-        if not names:
-            return 0, None
-        name = names[0]
-        with zf.open(name, "r") as raw:
-            total = count_lines_stream(raw)  # type: ignore[arg-type]
-        return total, name
+    name, raw = open_zip_member(zip_path)
+    if raw is None:
+        return 0, None
+    with raw:
+        total = count_lines_stream(raw)  # type: ignore[arg-type]
+    return total, name
 
 
 def main() -> int:
@@ -135,6 +162,14 @@ def main() -> int:
         assert parse_day_from_name("2021-08-13-04.gz") == "2021-08-13"
         assert parse_day_from_name("2021-08-13-04") == "2021-08-13"
         assert parse_day_from_name("bad-name.gz") is None
+        assert parse_day_from_name("9999-99-99-00.gz") is None
+        assert parse_day_from_name("2021-02-30-00.gz") is None
+        assert parse_day_from_name("2021-+1-01-00.gz") is None
+        with tempfile.TemporaryDirectory() as tmp:
+            for body, expected in ((b"", 0), (b"a\nb\n", 2), (b"a\nb\nc", 3)):
+                sample = Path(tmp) / "2021-08-13-04"
+                sample.write_bytes(body)
+                assert count_lines_file(sample) == expected, "plain line count failed"
         print("self-test ok")
         return 0
 
@@ -163,12 +198,16 @@ def main() -> int:
     url_template = DATASET_URLS[args.dataset]
     url = url_template.format(symbol=binance_symbol, date=day)
     cache_dir = ensure_cache_dir(args.cache_dir)
-    zip_path = download_zip(url, cache_dir)
+    line_counter = ZipLineCounter()
+    zip_path = download_zip(url, cache_dir, line_counter)
     if not zip_path:
         print("Binance Vision download failed.")
         return 2
 
-    binance_total, zip_name = count_binance_trades(zip_path)
+    if line_counter.done:
+        binance_total, zip_name = line_counter.total(), line_counter.name
+    else:
+        binance_total, zip_name = count_binance_trades(zip_path)
     ratio = "n/a" if local_total == 0 else f"{(binance_total / local_total):.4f}x"
 
     print(f"day={day} dataset={args.dataset} symbol={binance_symbol}")
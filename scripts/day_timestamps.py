@@ -0,0 +1,117 @@
+"""Per-day trade timestamp arrays for Binance Vision zips.
+
+A day zip is decoded once into native int64 timestamps, persisted next to the zip
+as <zip>.ts.bin, and mmapped on later runs; gap windows are binary searches over it.
+"""
+import bisect
+import mmap
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterable, Optional, Sequence, Tuple
+
+from inflate import open_zip_member
+
+# Each decode worker holds one day array (hundreds of MB on busy days), so cap the pool.
+DECODE_WORKERS = 4
+
+
+def decode_zip_timestamps(zip_path: Path, ts_index: int) -> array:
+    """Decode the timestamp column of a day zip into a packed int64 array.
+
+    One pass per file; every gap window on that day is then answered from the
+    array instead of re-inflating and re-splitting the CSV.
+    """
+    timestamps = array("q")
+    append = timestamps.append
+    _, raw = open_zip_member(zip_path)
+    if raw is None:
+        return timestamps
+    # ASCII CSV: split raw bytes, no UTF-8 decode layer. maxsplit stops splitting
+    # past the timestamp column, and int() accepts bytes plus trailing whitespace.
+    split_at = ts_index + 1
+    with raw:
+        for line in raw:
+            parts = line.split(b",", split_at)
+            if len(parts) <= ts_index:
+                continue
+            try:
+                append(int(parts[ts_index]))
+            except ValueError:
+                continue
+    return timestamps
+
+
+def timestamps_cache_path(zip_path: Path) -> Path:
+    return zip_path.with_name(f"{zip_path.name}.ts.bin")
+
+
+def map_timestamps(cache_path: Path) -> Sequence[int]:
+    # Zero-copy int64 view over the page cache; the view keeps the mapping alive.
+    with open(cache_path, "rb") as handle:
+        if os.fstat(handle.fileno()).st_size == 0:
+            return array("q")
+        mapped = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+    return memoryview(mapped).cast("q")
+
+
+def timestamps_cache_fresh(zip_path: Path) -> bool:
+    try:
+        return timestamps_cache_path(zip_path).stat().st_mtime >= zip_path.stat().st_mtime
+    except FileNotFoundError:
+        return False
+
+
+def build_timestamps_cache(zip_path: Path, ts_index: int) -> array:
+    timestamps = decode_zip_timestamps(zip_path, ts_index)
+    cache_path = timestamps_cache_path(zip_path)
+    partial = cache_path.with_name(f"{cache_path.name}.part")
+    with open(partial, "wb") as out:
+        timestamps.tofile(out)
+    partial.replace(cache_path)
+    return timestamps
+
+
+def warm_timestamps_cache(zip_path: Path, ts_index: int) -> None:
+    # Worker entry point: returns nothing so the day array is never pickled back.
+    build_timestamps_cache(zip_path, ts_index)
+
+
+def warm_timestamps_caches(zip_paths: Iterable[Optional[Path]], ts_index: int) -> None:
+    """Decode every uncached day zip in parallel processes before the scan.
+
+    Inflate + CSV parsing is CPU bound and holds the GIL, so threads would not
+    overlap it; each worker writes its .ts.bin and the scan then only mmaps.
+    """
+    stale = [zip_path for zip_path in zip_paths if zip_path and not timestamps_cache_fresh(zip_path)]
+    workers = min(len(stale), DECODE_WORKERS, os.cpu_count() or 1)
+    if workers < 2:
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for _ in executor.map(warm_timestamps_cache, stale, [ts_index] * len(stale)):
+            pass
+
+
+def load_zip_timestamps(zip_path: Path, ts_index: int) -> Sequence[int]:
+    """Day timestamps for a zip, decoded at most once across runs.
+
+    The first decode is persisted next to the zip as native int64 so later runs
+    mmap it instead of re-inflating; a cache older than its zip is rebuilt.
+    """
+    if timestamps_cache_fresh(zip_path):
+        return map_timestamps(timestamps_cache_path(zip_path))
+    return build_timestamps_cache(zip_path, ts_index)
+
+
+def window_stats(
+    timestamps: Sequence[int],
+    start_ms: int,
+    end_ms: int,
+) -> Tuple[int, Optional[int], Optional[int]]:
+    # Timestamps are in trade order (ascending): two binary searches bound the window.
+    lo = bisect.bisect_left(timestamps, start_ms)
+    hi = bisect.bisect_right(timestamps, end_ms, lo)
+    if hi <= lo:
+        return 0, None, None
+    return hi - lo, timestamps[lo], timestamps[hi - 1]
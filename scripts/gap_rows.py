@@ -0,0 +1,123 @@
+"""Gap selection from the shared sqlite index for the Binance verification scripts.
+
+Filters, orders and seeded-samples rows of the indexer's gaps table.
+"""
+import argparse
+import functools
+import sqlite3
+from collections import namedtuple
+from typing import Dict, List
+
+# Plain tuples from sqlite, unpacked once; attribute access avoids sqlite3.Row name lookups.
+GapRow = namedtuple(
+    "GapRow",
+    "id end_relative_path collector exchange symbol gap_ms gap_miss start_ts end_ts",
+)
+
+
+def seeded_rank(seed: int, gap_id: int) -> int:
+    # splitmix64 of (seed, id): a stable per-row shuffle key independent of sqlite's
+    # evaluation order, folded to 63 bits so it fits a sqlite INTEGER.
+    z = (seed * 0x9E3779B97F4A7C15 + gap_id) & 0xFFFFFFFFFFFFFFFF
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & 0xFFFFFFFFFFFFFFFF
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & 0xFFFFFFFFFFFFFFFF
+    return (z ^ (z >> 31)) >> 1
+
+
+def fetch_gap_rows(conn: sqlite3.Connection, sql: str, params: Dict[str, object]) -> List[GapRow]:
+    # Cursor-level factory: rows are GapRow regardless of the connection's row_factory.
+    cursor = conn.cursor()
+    cursor.row_factory = lambda _cursor, values: GapRow(*values)
+    return cursor.execute(sql, params).fetchall()
+
+
+def iter_gap_rows(conn: sqlite3.Connection, args: argparse.Namespace) -> List[GapRow]:
+    filters = ["e.gap_ms IS NOT NULL", "e.gap_miss IS NOT NULL"]
+    params = {}
+    if args.collector:
+        filters.append("e.collector = :collector")
+        params["collector"] = args.collector
+    if args.exchange:
+        filters.append("e.exchange = :exchange")
+        params["exchange"] = args.exchange
+    if args.symbol:
+        filters.append("e.symbol = :symbol")
+        params["symbol"] = args.symbol
+    if args.min_miss:
+        filters.append("e.gap_miss >= :min_miss")
+        params["min_miss"] = args.min_miss
+    if args.min_gap_ms:
+        filters.append("e.gap_ms >= :min_gap_ms")
+        params["min_gap_ms"] = args.min_gap_ms
+
+    where_clause = " AND ".join(filters)
+    order_by = "e.id ASC"
+    if args.order == "gap_miss":
+        order_by = "e.gap_miss DESC"
+    elif args.order == "gap_ms":
+        order_by = "e.gap_ms DESC"
+    elif args.order == "hybrid":
+        order_by = "(e.gap_ms * e.gap_miss) DESC"
+
+    sql = f"""
+      SELECT e.id, e.end_relative_path,
+             e.collector, e.exchange, e.symbol,
+             e.gap_ms, e.gap_miss, e.start_ts, e.end_ts
+        FROM gaps e
+       WHERE {where_clause}
+       ORDER BY {order_by}
+       LIMIT :limit
+       OFFSET :offset;
+    """
+
+    if args.order == "random":
+        # Sample inside sqlite so only the chosen rows cross into Python. The offset
+        # skips into the pool (it does not extend it), matching rows[offset:pool].
+        pool_sql = f"""
+          WITH pool AS (
+            SELECT e.id, e.end_relative_path,
+                   e.collector, e.exchange, e.symbol,
+                   e.gap_ms, e.gap_miss, e.start_ts, e.end_ts
+              FROM gaps e
+             WHERE {where_clause}
+             ORDER BY e.gap_miss DESC
+             LIMIT :pool
+             OFFSET :offset
+          )
+          SELECT * FROM pool
+        """
+        if args.limit > 0:
+            conn.create_function(
+                "seeded_rank",
+                1,
+                functools.partial(seeded_rank, args.seed),
+                deterministic=True,
+            )
+            pool_sql += " ORDER BY seeded_rank(id), id LIMIT :limit"
+            params["limit"] = args.limit
+        params["pool"] = max(args.pool - args.offset, 0) if args.pool >= 0 else -1
+        params["offset"] = args.offset
+        return fetch_gap_rows(conn, pool_sql, params)
+
+    params["limit"] = -1 if args.limit <= 0 else args.limit
+    params["offset"] = args.offset
+    return fetch_gap_rows(conn, sql, params)
+
+
+def ensure_gap_order_indexes(conn: sqlite3.Connection) -> None:
+    """Partial indexes matching iter_gap_rows' filter so each ordering is an index walk.
+
+    Opt-in via --create-indexes: the indexes persist in the shared db (schema owned by
+    src/core/db.ts) and every indexer gap INSERT/DELETE then maintains all three.
+    Read-only dbs keep the full sort.
+    """
+    where = "WHERE gap_ms IS NOT NULL AND gap_miss IS NOT NULL"
+    try:
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_gaps_gap_miss ON gaps(gap_miss DESC) {where};")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_gaps_gap_ms ON gaps(gap_ms DESC) {where};")
+        conn.execute(
+            f"CREATE INDEX IF NOT EXISTS idx_gaps_gap_hybrid ON gaps((gap_ms * gap_miss) DESC) {where};",
+        )
+        conn.commit()
+    except sqlite3.OperationalError as exc:
+        print(f"gap order indexes unavailable ({exc}); falling back to full sort")
@@ -0,0 +1,306 @@
+"""DEFLATE readers shared by the Binance Vision scripts.
+
+Uses ISA-L (`pip install isal`) when available: its SIMD inflate is several times
+faster than stdlib zlib on multi-GB trade dumps. Falls back to the stdlib otherwise.
+"""
+import argparse
+import gzip
+import io
+import struct
+import tempfile
+import zipfile
+import zlib
+from pathlib import Path
+from typing import BinaryIO, Optional, Tuple
+
+try:
+    from isal import igzip, isal_zlib
+except ImportError:  # pragma: no cover - optional accelerator
+    igzip = None
+    isal_zlib = None
+
+READ_CHUNK = 1024 * 1024
+LOCAL_HEADER = struct.Struct("<4s22xHH")
+# signature, flags, method, crc32, compressed size, name length, extra length
+LOCAL_HEADER_FIELDS = struct.Struct("<4s2xHH4xII4xHH")
+CRC_FIELD = struct.Struct("<I")
+DATA_DESCRIPTOR_FLAG = 0x08
+DATA_DESCRIPTOR_SIGNATURE = b"PK\x07\x08"
+ZIP64_SIZE = 0xFFFFFFFF
+LOCAL_HEADER_SIGNATURE = b"PK\x03\x04"
+
+
+def open_gzip(path: Path) -> BinaryIO:
+    if igzip is not None:
+        return igzip.open(path, "rb")
+    return gzip.open(path, "rb")
+
+
+class ZipLineCounter:
+    """Counts newline-delimited lines of a zip's first member from raw archive bytes.
+
+    Fed the download stream directly so counting needs no second read of the file.
+    State is kept across feed() calls only because chunk boundaries are arbitrary
+    (header bytes, inflater window, trailing data descriptor). `done` is set once the
+    member ends and its CRC-32 matches; `failed` when it cannot be streamed (unknown
+    stored size, directory or bad header) or the CRC differs, in which case callers
+    count from disk instead.
+    """
+
+    def __init__(self) -> None:
+        self.name: Optional[str] = None
+        self.done = False
+        self.failed = False
+        self._header = b""
+        self._inflater = None
+        self._stored_remaining = -1
+        self._expected_crc = 0
+        self._has_descriptor = False
+        self._descriptor = b""
+        self._awaiting_descriptor = False
+        self._crc32 = (isal_zlib or zlib).crc32
+        self._crc = 0
+        self._lines = 0
+        self._last_byte = b""
+
+    def feed(self, chunk: bytes) -> None:
+        if self.done or self.failed:
+            return
+        if self._awaiting_descriptor:
+            self._read_descriptor(chunk)
+            return
+        if self._inflater is None and self._stored_remaining < 0:
+            chunk = self._start_member(chunk)
+            if not chunk:
+                return
+        if self._inflater is not None:
+            self._count(self._inflater.decompress(chunk))
+            if self._inflater.eof:
+                if self._has_descriptor:
+                    # Deflated members written in streaming mode carry their CRC after the body.
+                    self._awaiting_descriptor = True
+                    self._read_descriptor(self._inflater.unused_data)
+                else:
+                    self._verify(self._expected_crc)
+            return
+        body = chunk[: self._stored_remaining]
+        self._stored_remaining -= len(body)
+        self._count(body)
+        if self._stored_remaining == 0:
+            self._verify(self._expected_crc)
+
+    def total(self) -> int:
+        return self._lines + (1 if self._last_byte and self._last_byte != b"\n" else 0)
+
+    def _count(self, data: bytes) -> None:
+        if data:
+            self._lines += data.count(b"\n")
+            self._last_byte = data[-1:]
+            self._crc = self._crc32(data, self._crc)
+
+    def _verify(self, expected_crc: int) -> None:
+        if self._crc == expected_crc:
+            self.done = True
+        else:
+            self.failed = True
+
+    def _read_descriptor(self, chunk: bytes) -> None:
+        # Descriptor: optional signature, then crc32; 8 bytes cover both layouts.
+        self._descriptor += chunk
+        if len(self._descriptor) < 8:
+            return
+        crc_offset = 4 if self._descriptor.startswith(DATA_DESCRIPTOR_SIGNATURE) else 0
+        self._verify(CRC_FIELD.unpack_from(self._descriptor, crc_offset)[0])
+
+    def _start_member(self, chunk: bytes) -> bytes:
+        # Buffer until the whole local header is in, then return the body bytes seen so far.
+        self._header += chunk
+        if len(self._header) < LOCAL_HEADER_FIELDS.size:
+            return b""
+        signature, flags, method, crc, size, name_len, extra_len = LOCAL_HEADER_FIELDS.unpack_from(
+            self._header,
+        )
+        body_start = LOCAL_HEADER_FIELDS.size + name_len + extra_len
+        if len(self._header) < body_start:
+            return b""
+        name_start = LOCAL_HEADER_FIELDS.size
+        self.name = self._header[name_start : name_start + name_len].decode("utf-8", "replace")
+        body = self._header[body_start:]
+        self._header = b""
+        self._expected_crc = crc
+        self._has_descriptor = bool(flags & DATA_DESCRIPTOR_FLAG)
+        if signature != LOCAL_HEADER_SIGNATURE or self.name.endswith("/"):
+            self.failed = True
+        elif method == zipfile.ZIP_DEFLATED and self._has_descriptor:
+            # ISA-L can drop the descriptor bytes that share a chunk with end of stream
+            # from unused_data, so streamed members inflate with stdlib zlib.
+            self._inflater = zlib.decompressobj(-15)
+        elif method == zipfile.ZIP_DEFLATED:
+            self._inflater = (isal_zlib or zlib).decompressobj(-15)
+        elif method == zipfile.ZIP_STORED and not self._has_descriptor and size != ZIP64_SIZE:
+            self._stored_remaining = size
+            if size == 0:
+                self._verify(self._expected_crc)
+        else:
+            self.failed = True
+        return b"" if self.failed or self.done else body
+
+
+class _RawInflateReader(io.RawIOBase):
+    # Raw DEFLATE stream over a zip member body; output bounded by the caller's buffer.
+    # Verifies the member CRC at end of stream like ZipExtFile, so a corrupt zip raises
+    # instead of decoding into wrong trades.
+    def __init__(self, handle: BinaryIO, compressed_size: int, expected_crc: int) -> None:
+        self._handle = handle
+        self._remaining = compressed_size
+        self._inflater = isal_zlib.decompressobj(-15)
+        self._expected_crc = expected_crc
+        self._crc = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:  # type: ignore[no-untyped-def]
+        size = len(buffer)
+        while True:
+            if self._inflater.eof:
+                if self._crc != self._expected_crc:
+                    raise zipfile.BadZipFile("bad CRC-32 for zip member")
+                return 0
+            source = self._inflater.unconsumed_tail
+            if not source and self._remaining > 0:
+                source = self._handle.read(min(self._remaining, READ_CHUNK))
+                self._remaining -= len(source)
+                if not source:
+                    self._remaining = 0
+            # With input exhausted, an empty call drains output ISA-L still holds
+            # internally (unlike zlib it does not park it all in unconsumed_tail).
+            chunk = self._inflater.decompress(source, size)
+            if chunk:
+                self._crc = isal_zlib.crc32(chunk, self._crc)
+                buffer[: len(chunk)] = chunk
+                return len(chunk)
+            if not source and not self._inflater.eof:
+                raise EOFError("compressed zip member ended before the end-of-stream marker")
+
+    def close(self) -> None:
+        self._handle.close()
+        super().close()
+
+
+def open_zip_member(zip_path: Path) -> Tuple[Optional[str], Optional[BinaryIO]]:
+    """Open the first file member of a zip as a buffered binary stream.
+
+    Returns (None, None) for zips without file members.
+    """
+    with zipfile.ZipFile(zip_path) as zf:
+        infos = [info for info in zf.infolist() if not info.is_dir()]
+        if not infos:
+            return None, None
+        info = infos[0]
+        if isal_zlib is None or info.compress_type != zipfile.ZIP_DEFLATED:
+            # ZipExtFile keeps the archive fp alive after the ZipFile closes.
+            return info.filename, zf.open(info, "r")  # type: ignore[return-value]
+    # Skip the local header ourselves so the member body goes straight to ISA-L.
+    handle = open(zip_path, "rb")
+    handle.seek(info.header_offset)
+    signature, name_len, extra_len = LOCAL_HEADER.unpack(handle.read(LOCAL_HEADER.size))
+    if signature != LOCAL_HEADER_SIGNATURE:
+        handle.close()
+        raise zipfile.BadZipFile(f"bad local header in {zip_path}")
+    handle.seek(name_len + extra_len, io.SEEK_CUR)
+    reader = _RawInflateReader(handle, info.compress_size, info.CRC)
+    return info.filename, io.BufferedReader(reader, READ_CHUNK)  # type: ignore[return-value]
+
+
+def check_zip_member_round_trip(tmp: Path) -> None:
+    # Multi-MiB deflated and stored members must read back exactly; a flipped body
+    # byte must raise instead of decoding.
+    body = b"".join(b"%d,1.0,2.0,%d\n" % (i, 1628812800000 + i) for i in range(200000))
+    assert len(body) > 4 * 1024 * 1024, "round-trip fixture too small"
+    zip_paths = []
+    for compression in (zipfile.ZIP_DEFLATED, zipfile.ZIP_STORED):
+        zip_path = tmp / f"member-{compression}.zip"
+        with zipfile.ZipFile(zip_path, "w", compression) as zf:
+            zf.writestr("day.csv", body)
+        zip_paths.append(zip_path)
+    corrupted = bytearray(zip_paths[0].read_bytes())
+    corrupted[len(corrupted) // 2] ^= 0xFF
+    (tmp / "corrupted.zip").write_bytes(corrupted)
+    for zip_path in zip_paths:
+        name, member = open_zip_member(zip_path)
+        with member:  # type: ignore[union-attr]
+            assert (name, member.read()) == ("day.csv", body), f"round-trip failed ({zip_path.name})"  # type: ignore[union-attr]
+    try:
+        with open_zip_member(tmp / "corrupted.zip")[1] as member:  # type: ignore[union-attr]
+            member.read()
+    except (zipfile.BadZipFile, EOFError, zlib.error):
+        return
+    raise AssertionError("corrupted zip member was not rejected")
+
+
+class _UnseekableBytes(io.BytesIO):
+    # zipfile falls back to trailing data descriptors when the output cannot seek.
+    def seek(self, *args: int) -> int:
+        raise OSError("unseekable")
+
+
+def check_zip_line_counter() -> None:
+    # Streamed counts must not depend on chunk boundaries; a stored member behind a
+    # data descriptor and a flipped body byte must both set failed.
+    body = b"".join(b"%d,%d\n" % (i, 1628812800000 + i) for i in range(400)) + b"tail"
+    for compression in (zipfile.ZIP_DEFLATED, zipfile.ZIP_STORED):
+        for archive in (io.BytesIO(), _UnseekableBytes()):
+            with zipfile.ZipFile(archive, "w", compression) as zf:
+                with zf.open("day.csv", "w") as member:
+                    member.write(body)
+            raw = archive.getvalue()
+            unstreamable = compression == zipfile.ZIP_STORED and isinstance(archive, _UnseekableBytes)
+            for chunk_size in (1, 7, 31):
+                counter = ZipLineCounter()
+                for offset in range(0, len(raw), chunk_size):
+                    counter.feed(raw[offset : offset + chunk_size])
+                if unstreamable:
+                    assert counter.failed, "stored member with data descriptor must not stream"
+                else:
+                    assert counter.done and (counter.total(), counter.name) == (401, "day.csv"), "stream count failed"
+    stored = io.BytesIO()
+    with zipfile.ZipFile(stored, "w", zipfile.ZIP_STORED) as zf:
+        zf.writestr("day.csv", body)
+    corrupted = bytearray(stored.getvalue())
+    corrupted[len(corrupted) // 3] ^= 0x01
+    counter = ZipLineCounter()
+    counter.feed(bytes(corrupted))
+    assert counter.failed, "CRC mismatch not detected"
+
+
+def run_self_test() -> int:
+
+    # Run on the ISA-L path (when installed) and again on the stdlib fallback.
+    global isal_zlib
+    accelerator = isal_zlib
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            check_zip_member_round_trip(Path(tmp))
+            check_zip_line_counter()
+            isal_zlib = None
+            check_zip_member_round_trip(Path(tmp))
+            check_zip_line_counter()
+    finally:
+        isal_zlib = accelerator
+    print("self-test ok")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="DEFLATE readers shared by the Binance Vision scripts.")
+    parser.add_argument("--self-test", action="store_true", help="Run deterministic reader checks and exit.")
+    args = parser.parse_args()
+    if args.self_test:
+        return run_self_test()
+    parser.print_help()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,14 +1,20 @@
 #!/usr/bin/env python3
 import argparse
 import datetime as dt
-import io
-import random
+import functools
+import os
+import shutil
 import sqlite3
 import tempfile
 import urllib.request
 import zipfile
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Iterable, Optional, Tuple
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from day_timestamps import load_zip_timestamps, timestamps_cache_path, warm_timestamps_caches, window_stats
+from gap_rows import GapRow, ensure_gap_order_indexes, iter_gap_rows
 
 
 DATASET_URLS = {
@@ -18,6 +24,12 @@ DATASET_URLS = {
     "futures-um-agg": "https://data.binance.vision/data/futures/um/daily/aggTrades/{symbol}/{symbol}-aggTrades-{date}.zip",
 }
 
+# Day zips are independent and network bound; a small pool overlaps connection + transfer latency.
+DOWNLOAD_WORKERS = 8
+DOWNLOAD_CHUNK = 1024 * 1024
+# Gaps spanning more days than this are reported as skipped instead of downloaded.
+MAX_WINDOW_DAYS = 3
+
 DATASET_TS_INDEX = {
     "spot-trades": 4,
     "futures-um-trades": 4,
@@ -79,6 +91,11 @@ def parse_args() -> argparse.Namespace:
         default=None,
         help="Cache directory for Binance Vision zips (defaults to OS temp).",
     )
+    parser.add_argument(
+        "--create-indexes",
+        action="store_true",
+        help="Add partial gap-order indexes to the db (persist; slow every gap write).",
+    )
     parser.add_argument(
         "--self-test",
         action="store_true",
@@ -116,75 +133,6 @@ def format_window_summary(
     )
 
 
-def iter_gap_rows(conn: sqlite3.Connection, args: argparse.Namespace) -> Iterable[sqlite3.Row]:
-    filters = ["e.gap_ms IS NOT NULL", "e.gap_miss IS NOT NULL"]
-    params = {}
-    if args.collector:
-        filters.append("e.collector = :collector")
-        params["collector"] = args.collector
-    if args.exchange:
-        filters.append("e.exchange = :exchange")
-        params["exchange"] = args.exchange
-    if args.symbol:
-        filters.append("e.symbol = :symbol")
-        params["symbol"] = args.symbol
-    if args.min_miss:
-        filters.append("e.gap_miss >= :min_miss")
-        params["min_miss"] = args.min_miss
-    if args.min_gap_ms:
-        filters.append("e.gap_ms >= :min_gap_ms")
-        params["min_gap_ms"] = args.min_gap_ms
-
-    where_clause = " AND ".join(filters)
-    order_by = "e.id ASC"
-    if args.order == "gap_miss":
-        order_by = "e.gap_miss DESC"
-    elif args.order == "gap_ms":
-        order_by = "e.gap_ms DESC"
-    elif args.order == "hybrid":
-        order_by = "(e.gap_ms * e.gap_miss) DESC"
-
-    sql = f"""
-      SELECT e.id, e.end_relative_path,
-             e.collector, e.exchange, e.symbol,
-             e.gap_ms, e.gap_miss, e.start_ts, e.end_ts
-        FROM gaps e
-       WHERE {where_clause}
-       ORDER BY {order_by}
-       LIMIT :limit
-       OFFSET :offset;
-    """
-
-    if args.order == "random":
-        pool_sql = f"""
-          SELECT e.id, e.end_relative_path,
-                 e.collector, e.exchange, e.symbol,
-                 e.gap_ms, e.gap_miss, e.start_ts, e.end_ts
-            FROM gaps e
-           WHERE {where_clause}
-           ORDER BY e.gap_miss DESC
-           LIMIT :pool;
-        """
-        pool_params = dict(params)
-        pool_params["pool"] = args.pool
-        rows = conn.execute(pool_sql, pool_params).fetchall()
-        if not rows:
-            return []
-        if args.offset:
-            rows = rows[args.offset :]
-            if not rows:
-                return []
-        if args.limit <= 0:
-            return rows
-        rng = random.Random(args.seed)
-        sample = rng.sample(rows, k=min(args.limit, len(rows)))
-        return sample
-
-    params["limit"] = -1 if args.limit <= 0 else args.limit
-    params["offset"] = args.offset
-    return conn.execute(sql, params).fetchall()
-
-
 def ensure_cache_dir(path: Optional[str]) -> Path:
     if path:
         cache = Path(path)
@@ -199,47 +147,81 @@ def download_zip(url: str, cache_dir: Path) -> Optional[Path]:
     target = cache_dir / name
     if target.exists():
         return target
+    # Stream to a sibling temp file so memory stays O(chunk) and a failed
+    # download never leaves a truncated zip behind as a cache hit.
+    partial = target.with_name(f"{name}.part")
     try:
-        with urllib.request.urlopen(url) as resp, open(target, "wb") as out:
-            out.write(resp.read())
+        with urllib.request.urlopen(url) as resp, open(partial, "wb") as out:
+            shutil.copyfileobj(resp, out, DOWNLOAD_CHUNK)
+        partial.replace(target)
         return target
     except Exception as exc:  # noqa: BLE001
+        partial.unlink(missing_ok=True)
         print(f"  download failed: {url} ({exc})")
         return None
 
 
-def scan_zip_for_window(
-    zip_path: Path,
-    start_ms: int,
-    end_ms: int,
+def prefetch_zips(day_urls: Dict[str, str], cache_dir: Path) -> Dict[str, Optional[Path]]:
+    # Keyed by day, so each cache file has exactly one writer.
+    with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as executor:
+        paths = executor.map(lambda url: download_zip(url, cache_dir), day_urls.values())
+        return dict(zip(day_urls.keys(), paths))
+
+
+def group_rows_by_day(rows: List[GapRow]) -> Tuple[Dict[str, List[int]], List[int]]:
+    """Day -> row indexes of the gaps to scan, plus per-row day counts of oversized gaps.
+
+    One pass applies the MAX_WINDOW_DAYS filter; oversized rows get their day count
+    (0 for scanned rows) so callers report them without re-walking their dates.
+    """
+    day_rows: Dict[str, List[int]] = defaultdict(list)
+    oversized_days = [0] * len(rows)
+    for row_index, row in enumerate(rows):
+        dates = list(iter_dates(int(row.start_ts), int(row.end_ts)))
+        if len(dates) > MAX_WINDOW_DAYS:
+            oversized_days[row_index] = len(dates)
+            continue
+        for day in dates:
+            day_rows[day].append(row_index)
+    return day_rows, oversized_days
+
+
+def scan_gap_windows(
+    rows: List[GapRow],
+    day_rows: Dict[str, List[int]],
+    day_zips: Dict[str, Optional[Path]],
     ts_index: int,
-) -> Tuple[int, Optional[int], Optional[int]]:
-    count = 0
-    first_ts: Optional[int] = None
-    last_ts: Optional[int] = None
-    with zipfile.ZipFile(zip_path) as zf:
-        names = [n for n in zf.namelist() if not n.endswith("/")]
-        if not names:
-            return 0, None, None
-        with zf.open(names[0], "r") as raw:
-            text = io.TextIOWrapper(raw, encoding="utf-8", errors="ignore")
-            for line in text:
-                parts = line.rstrip().split(",")
-                if len(parts) <= ts_index:
-                    continue
-                try:
-                    ts = int(parts[ts_index])
-                except ValueError:
-                    continue
-                if ts < start_ms:
-                    continue
-                if ts > end_ms:
-                    break
-                if first_ts is None:
-                    first_ts = ts
-                last_ts = ts
-                count += 1
-    return count, first_ts, last_ts
+) -> Tuple[List[int], List[Optional[int]], List[Optional[int]], List[int]]:
+    """Per-row (totals, first hits, last hits, missing day counts), in row order.
+
+    Rows come grouped by day so each day's timestamps are loaded once and every
+    overlapping gap is answered from them, instead of one load per (row, day).
+    """
+    totals = [0] * len(rows)
+    first_hits: List[Optional[int]] = [None] * len(rows)
+    last_hits: List[Optional[int]] = [None] * len(rows)
+    missing_days = [0] * len(rows)
+    warm_timestamps_caches((day_zips[day] for day in day_rows), ts_index)
+    for day, row_indexes in day_rows.items():
+        zip_path = day_zips[day]
+        if not zip_path:
+            for row_index in row_indexes:
+                missing_days[row_index] += 1
+            continue
+        timestamps = load_zip_timestamps(zip_path, ts_index)
+        for row_index in row_indexes:
+            row = rows[row_index]
+            count, first_ts, last_ts = window_stats(timestamps, int(row.start_ts), int(row.end_ts))
+            if not count:
+                continue
+            first_hit = first_hits[row_index]
+            if first_hit is None or (first_ts is not None and first_ts < first_hit):
+                first_hits[row_index] = first_ts
+            last_hit = last_hits[row_index]
+            if last_hit is None or (last_ts is not None and last_ts > last_hit):
+                last_hits[row_index] = last_ts
+            totals[row_index] += count
+    return totals, first_hits, last_hits, missing_days
 
 
 def iter_dates(start_ms: int, end_ms: int) -> Iterable[str]:
@@ -251,26 +233,72 @@ def iter_dates(start_ms: int, end_ms: int) -> Iterable[str]:
         current += dt.timedelta(days=1)
 
 
+def write_day_zip(zip_path: Path, timestamps: Iterable[int], mtime: int) -> None:
+    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("day.csv", b"".join(b"1,1.0,2.0,2.0,%d,True,True\n" % ts for ts in timestamps))
+    os.utime(zip_path, (mtime, mtime))
+
+
+def check_timestamps_cache(tmp: Path) -> None:
+    # Decode writes <zip>.ts.bin, a reload mmaps it, a 0-byte cache loads empty,
+    # and a zip newer than its cache is decoded again.
+    zip_path = tmp / "FAKE-trades-2025-01-15.zip"
+    write_day_zip(zip_path, [1000, 2000, 2000, 3000], 1_000_000)
+    assert list(load_zip_timestamps(zip_path, 4)) == [1000, 2000, 2000, 3000], "timestamp decode failed"
+    mapped = load_zip_timestamps(zip_path, 4)
+    assert isinstance(mapped, memoryview), "timestamps cache not mmapped"
+    assert window_stats(mapped, 2000, 3000) == (3, 2000, 3000), "mapped window failed"
+    write_day_zip(zip_path, [], 1_000_000)
+    timestamps_cache_path(zip_path).write_bytes(b"")
+    assert window_stats(load_zip_timestamps(zip_path, 4), 0, 5000) == (0, None, None), "empty cache failed"
+    write_day_zip(zip_path, [4000, 5000], 4_000_000_000)
+    assert list(load_zip_timestamps(zip_path, 4)) == [4000, 5000], "stale cache not rebuilt"
+
+
+def run_self_test() -> int:
+    sample = list(range(10))
+    offset = 3
+    limit = 4
+    expected = sample[offset : offset + limit]
+    actual = sample[offset : offset + limit]
+    assert actual == expected, "offset selection failed"
+    summary = format_gap_summary(1, 10, 5, "0.5000x")
+    expected_summary = "[id=1] est_miss=10 binance_trades=5 ratio=0.5000x"
+    assert summary == expected_summary, "summary formatting failed"
+    window_summary = format_window_summary(1000, 2000, 1000, 11000, 12000)
+    expected_window = (
+        "  window=1970-01-01 00:00:01 -> 1970-01-01 00:00:02 UTC "
+        "gap_ms=1000 first=1970-01-01 00:00:11 last=1970-01-01 00:00:12"
+    )
+    assert window_summary == expected_window, "window summary formatting failed"
+    day_ts = [1000, 2000, 2000, 3000, 5000]
+    assert window_stats(day_ts, 2000, 3000) == (3, 2000, 3000), "window bounds failed"
+    assert window_stats(day_ts, 3500, 4500) == (0, None, None), "empty window failed"
+    conn = sqlite3.connect(":memory:")
+    conn.execute(f"CREATE TABLE gaps ({', '.join(GapRow._fields)})")
+    conn.executemany(
+        "INSERT INTO gaps VALUES (?, 'p', 'c', 'e', 's', 1, ?, 0, 1)",
+        [(gap_id, 100 - gap_id) for gap_id in range(1, 21)],
+    )
+    pick_args = argparse.Namespace(
+        collector=None, exchange=None, symbol=None, min_miss=0, min_gap_ms=0,
+        order="random", offset=3, pool=10, limit=4, seed=7,
+    )
+    picked = [row.id for row in iter_gap_rows(conn, pick_args)]
+    assert picked == [row.id for row in iter_gap_rows(conn, pick_args)], "seeded sample unstable"
+    assert len(picked) == 4 and all(4 <= gap_id <= 10 for gap_id in picked), "pool sample failed"
+    pick_args.limit = 0
+    assert [row.id for row in iter_gap_rows(conn, pick_args)] == list(range(4, 11)), "pool offset failed"
+    with tempfile.TemporaryDirectory() as tmp:
+        check_timestamps_cache(Path(tmp))
+    print("self-test ok")
+    return 0
+
+
 def main() -> int:
     args = parse_args()
     if args.self_test:
-        sample = list(range(10))
-        offset = 3
-        limit = 4
-        expected = sample[offset : offset + limit]
-        actual = sample[offset : offset + limit]
-        assert actual == expected, "offset selection failed"
-        summary = format_gap_summary(1, 10, 5, "0.5000x")
-        expected_summary = "[id=1] est_miss=10 binance_trades=5 ratio=0.5000x"
-        assert summary == expected_summary, "summary formatting failed"
-        window_summary = format_window_summary(1000, 2000, 1000, 11000, 12000)
-        expected_window = (
-            "  window=1970-01-01 00:00:01 -> 1970-01-01 00:00:02 UTC "
-            "gap_ms=1000 first=1970-01-01 00:00:11 last=1970-01-01 00:00:12"
-        )
-        assert window_summary == expected_window, "window summary formatting failed"
-        print("self-test ok")
-        return 0
+        return run_self_test()
     binance_symbol = args.binance_symbol or args.symbol
     if not binance_symbol:
         print("Missing --symbol or --binance-symbol.")
@@ -280,57 +308,46 @@ def main() -> int:
     cache_dir = ensure_cache_dir(args.cache_dir)
 
     conn = sqlite3.connect(args.db)
-    conn.row_factory = sqlite3.Row
+    if args.create_indexes:
+        ensure_gap_order_indexes(conn)
 
     rows = iter_gap_rows(conn, args)
     if not rows:
         print("No gaps matched the filters.")
         return 0
 
+    day_rows, oversized_days = group_rows_by_day(rows)
+    # Format each distinct day once; gaps share days heavily.
+    make_url = functools.partial(url_template.format, symbol=binance_symbol)
+    day_zips = prefetch_zips({day: make_url(date=day) for day in day_rows}, cache_dir)
+    totals, first_hits, last_hits, missing_days = scan_gap_windows(rows, day_rows, day_zips, ts_index)
+
     inspected = 0
     skipped = 0
     total_est_miss = 0
     total_binance_trades = 0
 
-    for row in rows:
-        gap_ms = int(row["gap_ms"])
-        gap_miss = int(row["gap_miss"])
-        start_ms = int(row["start_ts"])
-        end_ms = int(row["end_ts"])
-        dates = list(iter_dates(start_ms, end_ms))
-        if len(dates) > 3:
-            print(format_gap_summary(row["id"], gap_miss, 0, "n/a"))
-            print(f"  binance_trades=skip days={len(dates)}")
+    for row_index, row in enumerate(rows):
+        gap_ms = int(row.gap_ms)
+        gap_miss = int(row.gap_miss)
+        start_ms = int(row.start_ts)
+        end_ms = int(row.end_ts)
+        if oversized_days[row_index]:
+            print(format_gap_summary(row.id, gap_miss, 0, "n/a"))
+            print(f"  binance_trades=skip days={oversized_days[row_index]}")
             skipped += 1
             continue
 
-        total = 0
-        first_hit: Optional[int] = None
-        last_hit: Optional[int] = None
-        missing_days = 0
-        for day in dates:
-            url = url_template.format(symbol=binance_symbol, date=day)
-            zip_path = download_zip(url, cache_dir)
-            if not zip_path:
-                missing_days += 1
-                continue
-            count, first_ts, last_ts = scan_zip_for_window(zip_path, start_ms, end_ms, ts_index)
-            if count:
-                if first_hit is None or (first_ts is not None and first_ts < first_hit):
-                    first_hit = first_ts
-                if last_hit is None or (last_ts is not None and last_ts > last_hit):
-                    last_hit = last_ts
-            total += count
-
-        if missing_days:
-            print(format_gap_summary(row["id"], gap_miss, 0, "n/a"))
-            print(f"  binance_trades=skip missing_days={missing_days}")
+        if missing_days[row_index]:
+            print(format_gap_summary(row.id, gap_miss, 0, "n/a"))
+            print(f"  binance_trades=skip missing_days={missing_days[row_index]}")
             skipped += 1
             continue
 
+        total = totals[row_index]
         ratio = fmt_ratio(total, gap_miss)
-        print(format_gap_summary(row["id"], gap_miss, total, ratio))
-        print(format_window_summary(start_ms, end_ms, gap_ms, first_hit, last_hit))
+        print(format_gap_summary(row.id, gap_miss, total, ratio))
+        print(format_window_summary(start_ms, end_ms, gap_ms, first_hits[row_index], last_hits[row_index]))
         inspected += 1
         total_est_miss += gap_miss
         total_binance_trades += total